@@ -19,6 +19,10 @@ CLUSTER_STATUS_PERIOD_SEC = int(os.environ.get("CLUSTER_STATUS_PERIOD_SEC", 60 *
 DISCOVERY_CHECK_THRESHOLD_SEC = int(os.environ.get("DISCOVERY_CHECK_THRESHOLD_SEC", 60 * 90))  # 90 min
 DISCOVERY_PROCESS_TIMEOUT_SEC = int(os.environ.get("DISCOVERY_PROCESS_TIMEOUT_SEC", 60 * 120))  # 120 min
 SUPABASE_LOGIN_RATE_LIMIT_SEC = int(os.environ.get("SUPABASE_LOGIN_RATE_LIMIT_SEC", 900))
+# publish the cluster status and node count with a single rpc. Requires the update_cluster_status_and_nodes function
+SUPABASE_COMBINED_HEARTBEAT = os.environ.get("SUPABASE_COMBINED_HEARTBEAT", "false").lower() == "true"
+# persist the scan results and scan meta with a single rpc. Requires the persist_scan_full function
+SUPABASE_COMBINED_SCAN_PERSIST = os.environ.get("SUPABASE_COMBINED_SCAN_PERSIST", "false").lower() == "true"
 GRAFANA_RENDERER_URL = os.environ.get("GRAFANA_RENDERER_URL", "http://127.0.0.1:8281/render")
 RESOURCE_UPDATES_CACHE_TTL_SEC = os.environ.get("RESOURCE_UPDATES_CACHE_TTL_SEC", 120)
 INTERNAL_PLAYBOOKS_ROOT = os.environ.get("INTERNAL_PLAYBOOKS_ROOT", "/app/src/robusta/core/playbooks/internal")
@@ -79,5 +83,6 @@ ADDITIONAL_CERTIFICATE: str = os.environ.get("CERTIFICATE", "")
 
 DISCOVERY_MAX_BATCHES = int(os.environ.get("DISCOVERY_MAX_BATCHES", 25))
 DISCOVERY_BATCH_SIZE = int(os.environ.get("DISCOVERY_BATCH_SIZE", 2000))
+DISCOVERY_PUBLISH_WORKERS = int(os.environ.get("DISCOVERY_PUBLISH_WORKERS", 5))
 
 DISABLE_HELM_MONITORING = bool(os.environ.get("DISABLE_HELM_MONITORING", False))
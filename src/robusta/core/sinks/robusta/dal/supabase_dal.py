@@ -1,16 +1,20 @@
 import json
 import logging
+import random
+import sched
 import threading
 import time
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import requests
 from postgrest_py.request_builder import QueryRequestBuilder
+from requests.adapters import HTTPAdapter
 from supabase_py import Client
 from supabase_py.lib.auth_client import SupabaseAuthClient
+from urllib3.util.retry import Retry
 
 from robusta.core.model.cluster_status import ClusterStatus
-from robusta.core.model.env_vars import SUPABASE_LOGIN_RATE_LIMIT_SEC
+from robusta.core.model.env_vars import SUPABASE_COMBINED_SCAN_PERSIST, SUPABASE_LOGIN_RATE_LIMIT_SEC
 from robusta.core.model.helm_release import HelmRelease
 from robusta.core.model.jobs import JobInfo
 from robusta.core.model.namespaces import NamespaceInfo
@@ -22,6 +26,21 @@ from robusta.core.reporting.blocks import ScanReportBlock, ScanReportRow
 from robusta.core.reporting.consts import EnrichmentAnnotation
 from robusta.core.sinks.robusta.dal.model_conversion import ModelConversion
 
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    json_loads = orjson.loads
+except ImportError:  # orjson isn't a robusta dependency, it's only used when installed separately
+
+    def json_dumps(obj: Any) -> bytes:
+        # same encoding as requests json=, invalid values (NaN) are reported by supabase as a failed response
+        return json.dumps(obj).encode("utf-8")
+
+    json_loads = json.loads
+
 SERVICES_TABLE = "Services"
 NODES_TABLE = "Nodes"
 EVIDENCE_TABLE = "Evidence"
@@ -31,7 +50,88 @@ JOBS_TABLE = "Jobs"
 HELM_RELEASES_TABLE = "HelmReleases"
 NAMESPACES_TABLE = "Namespaces"
 UPDATE_CLUSTER_NODE_COUNT = "update_cluster_node_count"
+UPDATE_CLUSTER_STATUS_AND_NODES = "update_cluster_status_and_nodes"
 SCANS_RESULT_TABLE = "ScansResults"
+INSERT_SCAN_META = "insert_scan_meta"
+PERSIST_SCAN_FULL = "persist_scan_full"
+INSERT_BATCH_SIZE = 1000
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 32
+HTTP_TIMEOUT_SEC = 60
+HTTP_RETRY_TOTAL = 5
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUS_CODES = [429, 502, 503, 504]
+HTTP_POST_RETRY_STATUS_CODES = [429, 503]
+HTTP_RETRY_JITTER_SEC = 0.5
+HTTP_RETRY_AFTER_MAX_SEC = 10
+AUTH_ERROR_STATUS_CODES = [401, 403]
+# statuses caused by the content of the inserted rows. Other rows of the same request may be valid
+ROW_CONTENT_ERROR_STATUS_CODES = [400, 409, 413, 422]
+RETURN_REPRESENTATION = "return=representation"
+RETURN_MINIMAL = "return=minimal"
+JSON_CONTENT_TYPE = "application/json"
+
+
+class SupabaseRetry(Retry):
+    """
+    Inserts are POST requests, and aren't idempotent. A POST is retried only on statuses where supabase didn't
+    process the request. Other methods are retried on all the status_forcelist statuses
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method.upper() == "POST":
+            return status_code in HTTP_POST_RETRY_STATUS_CODES
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self) -> float:
+        # jitter, so concurrent callers that failed together don't retry together
+        return super().get_backoff_time() + random.uniform(0, HTTP_RETRY_JITTER_SEC)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        # BACKOFF_MAX doesn't apply to the server Retry-After, and a long one would block the calling thread
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, HTTP_RETRY_AFTER_MAX_SEC)
+
+
+class RefreshScheduler:
+    """
+    Runs the jwt refresh tasks of all the auth clients on a single daemon thread,
+    instead of starting a new thread for every refresh
+    """
+
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _scheduler: Optional[sched.scheduler] = None
+
+    @classmethod
+    def schedule(cls, delay_sec: float, callback: Callable):
+        with cls._lock:
+            if cls._scheduler is None:
+                cls._scheduler = sched.scheduler(time.time, cls._wait)
+                threading.Thread(target=cls._run, name="supabase-token-refresh", daemon=True).start()
+
+        cls._scheduler.enter(delay_sec, 1, cls._run_task, (callback,))
+        cls._wakeup.set()  # a sleeping scheduler should pick up the new task
+
+    @classmethod
+    def _wait(cls, timeout_sec: float):
+        cls._wakeup.wait(timeout_sec)
+        cls._wakeup.clear()
+
+    @classmethod
+    def _run(cls):
+        while True:
+            cls._scheduler.run()
+            cls._wait(None)
+
+    @staticmethod
+    def _run_task(callback: Callable):
+        try:
+            callback()
+        except Exception:
+            logging.error("Failed to run supabase token refresh task", exc_info=True)
 
 
 class RobustaAuthClient(SupabaseAuthClient):
@@ -40,23 +140,35 @@ class RobustaAuthClient(SupabaseAuthClient):
         # _set_timeout isn't implemented in gotrue client. it's required for the jwt refresh token timer task
         # https://github.com/supabase/gotrue-py/blob/49c092e3a4a6d7bb5e1c08067a4c42cc2f74b5cc/gotrue/client.py#L242
         # callback, timeout_ms
-        threading.Timer(args[2] / 1000, args[1]).start()
+        RefreshScheduler.schedule(args[2] / 1000, args[1])
 
 
 class RobustaClient(Client):
+    # (access token, headers) pair, replaced as a whole so concurrent callers never see a mismatched pair
+    _cached_auth: Optional[Tuple[str, Dict[str, str]]] = None
+
     def _get_auth_headers(self) -> Dict[str, str]:
         auth = getattr(self, "auth", None)
         session = auth.current_session if auth else None
         if session and session["access_token"]:
-            access_token = auth.session()["access_token"]
+            access_token = session["access_token"]
         else:
             access_token = self.supabase_key
 
-        headers: Dict[str, str] = {
-            "apiKey": self.supabase_key,
-            "Authorization": f"Bearer {access_token}",
-        }
-        return headers
+        # sign in and token refresh replace the access token, which invalidates the cached headers
+        cached = self._cached_auth
+        if cached is None or cached[0] != access_token:
+            cached = (
+                access_token,
+                {
+                    "apiKey": self.supabase_key,
+                    "Authorization": f"Bearer {access_token}",
+                },
+            )
+            self._cached_auth = cached
+
+        # shared between calls. Callers should copy it before adding headers
+        return cached[1]
 
     @staticmethod
     def _init_supabase_auth_client(
@@ -80,6 +192,25 @@ class RobustaClient(Client):
 
 
 class SupabaseDal:
+    __slots__ = (
+        "url",
+        "key",
+        "account_id",
+        "cluster",
+        "client",
+        "_http",
+        "_rest_url",
+        "_row_stamp",
+        "_scope_params",
+        "_services_scope_params",
+        "email",
+        "password",
+        "sign_in_time",
+        "_sign_in_lock",
+        "sink_name",
+        "signing_key",
+    )
+
     def __init__(
             self,
             url: str,
@@ -96,13 +227,50 @@ class SupabaseDal:
         self.account_id = account_id
         self.cluster = cluster_name
         self.client = RobustaClient(url, key)
+        self._http = self.__create_http_session()
+        self._rest_url = f"{url.rstrip('/')}/rest/v1"
+        # columns shared by all the cluster resources rows
+        self._row_stamp = {"account_id": account_id, "cluster_id": cluster_name, "updated_at": "now()"}
+        # PostgREST filters selecting the active cluster rows
+        self._scope_params = {
+            "account_id": f"eq.{account_id}",
+            "cluster_id": f"eq.{cluster_name}",
+            "deleted": "eq.false",
+        }
+        # the services table cluster column is named cluster
+        self._services_scope_params = {
+            "account_id": f"eq.{account_id}",
+            "cluster": f"eq.{cluster_name}",
+            "deleted": "eq.false",
+        }
         self.email = email
         self.password = password
         self.sign_in_time = 0
+        self._sign_in_lock = threading.Lock()
         self.sign_in()
         self.sink_name = sink_name
         self.signing_key = signing_key
 
+    @staticmethod
+    def __create_http_session() -> requests.Session:
+        # A single session shared by all the dal calls, so connections to supabase are kept alive and reused
+        session = requests.Session()
+        # Retry with exponential backoff on rate limiting and transient gateway errors, honoring Retry-After.
+        # Read errors aren't retried, the request may have been processed already.
+        # When retries are exhausted, the last response is returned, and handled by the callers status checks
+        retry = SupabaseRetry(
+            total=HTTP_RETRY_TOTAL,
+            read=0,
+            backoff_factor=HTTP_RETRY_BACKOFF_FACTOR,
+            status_forcelist=HTTP_RETRY_STATUS_CODES,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def __to_db_scanResult(self, scanResult: ScanReportRow) -> Dict[Any, Any]:
         db_sr = scanResult.dict()
         db_sr["account_id"] = self.account_id
@@ -115,39 +283,45 @@ class SupabaseDal:
                 continue
 
             db_scanResults = [self.__to_db_scanResult(sr) for sr in block.results]
-            res = self.client.table(SCANS_RESULT_TABLE).insert(db_scanResults).execute()
+            scan_meta = {
+                "_account_id": self.account_id,
+                "_cluster": self.cluster,
+                "_scan_id": block.scan_id,
+                "_scan_start": str(block.start_time),
+                "_scan_end": str(block.end_time),
+                "_type": block.type,
+                "_grade": block.score,
+            }
+
+            if SUPABASE_COMBINED_SCAN_PERSIST:
+                # scan results and scan meta are written in a single transaction
+                res = self.__rpc_patch(PERSIST_SCAN_FULL, {"_results": db_scanResults, **scan_meta})
+                if res.get("status_code") not in [200, 201, 204]:
+                    msg = f"Failed to persist scan {block.scan_id} error: {res.get('data')}"
+                    logging.error(msg)
+                    self.handle_supabase_error(res.get("status_code"))
+                    raise Exception(msg)
+                continue
+
+            res = self.__execute(self.client.table(SCANS_RESULT_TABLE).insert(db_scanResults))
             if res.get("status_code") not in [200, 201]:
                 msg = f"Failed to persist scan {block.scan_id} error: {res.get('data')}"
                 logging.error(msg)
-                self.handle_supabase_error()
+                self.handle_supabase_error(res.get("status_code"))
                 raise Exception(msg)
 
-            res = self.__rpc_patch(
-                "insert_scan_meta",
-                {
-                    "_account_id": self.account_id,
-                    "_cluster": self.cluster,
-                    "_scan_id": block.scan_id,
-                    "_scan_start": str(block.start_time),
-                    "_scan_end": str(block.end_time),
-                    "_type": block.type,
-                    "_grade": block.score,
-                },
-            )
-
+            res = self.__rpc_patch(INSERT_SCAN_META, scan_meta)
             if res.get("status_code") not in [200, 201, 204]:
                 msg = f"Failed to persist scan meta {block.scan_id} error: {res.get('data')}"
                 logging.error(msg)
-                self.handle_supabase_error()
+                self.handle_supabase_error(res.get("status_code"))
                 raise Exception(msg)
 
     def persist_finding(self, finding: Finding):
 
         scans, enrichments = [], []
         for enrich in finding.enrichments:
-            scans.append(enrich) if enrich.annotations.get(EnrichmentAnnotation.SCAN, False) else enrichments.append(
-                enrich
-            )
+            (scans if enrich.annotations.get(EnrichmentAnnotation.SCAN, False) else enrichments).append(enrich)
 
         for scan in scans:
             self.persist_scan(scan)
@@ -155,35 +329,51 @@ class SupabaseDal:
         if (len(scans) > 0) and (len(enrichments)) == 0:
             return
 
-        for enrichment in enrichments:
-            res = (
-                self.client.table(EVIDENCE_TABLE)
-                .insert(
-                    ModelConversion.to_evidence_json(
-                        account_id=self.account_id,
-                        cluster_id=self.cluster,
-                        sink_name=self.sink_name,
-                        signing_key=self.signing_key,
-                        finding_id=finding.id,
-                        enrichment=enrichment,
-                    )
-                )
-                .execute()
+        self.__persist_evidence(finding, enrichments)
+
+        res = self.__execute(
+            self.client.table(ISSUES_TABLE).insert(
+                ModelConversion.to_finding_json(self.account_id, self.cluster, finding)
+            )
+        )
+        if res.get("status_code") != 201:
+            logging.error(f"Failed to persist finding {finding.id} error: {res.get('data')}")
+            self.handle_supabase_error(res.get("status_code"))
+
+    def __persist_evidence(self, finding: Finding, enrichments: List[Enrichment]):
+        if not enrichments:
+            return
+
+        evidence_rows = [
+            ModelConversion.to_evidence_json(
+                account_id=self.account_id,
+                cluster_id=self.cluster,
+                sink_name=self.sink_name,
+                signing_key=self.signing_key,
+                finding_id=finding.id,
+                enrichment=enrichment,
             )
+            for enrichment in enrichments
+        ]
+
+        res = self.__execute(self.client.table(EVIDENCE_TABLE).insert(evidence_rows))
+        status_code = res.get("status_code")
+        if status_code == 201:
+            return
+
+        if len(evidence_rows) == 1 or status_code not in ROW_CONTENT_ERROR_STATUS_CODES:
+            logging.error(f"Failed to persist finding {finding.id} enrichments {enrichments} error: {res.get('data')}")
+            self.handle_supabase_error(status_code)
+            return
+
+        # The bulk insert is rejected as a whole if a single row is invalid. Insert row by row, to keep the valid ones
+        for enrichment, evidence_row in zip(enrichments, evidence_rows):
+            res = self.__execute(self.client.table(EVIDENCE_TABLE).insert(evidence_row))
             if res.get("status_code") != 201:
                 logging.error(
                     f"Failed to persist finding {finding.id} enrichment {enrichment} error: {res.get('data')}"
                 )
 
-        res = (
-            self.client.table(ISSUES_TABLE)
-            .insert(ModelConversion.to_finding_json(self.account_id, self.cluster, finding))
-            .execute()
-        )
-        if res.get("status_code") != 201:
-            logging.error(f"Failed to persist finding {finding.id} error: {res.get('data')}")
-            self.handle_supabase_error()
-
     def to_service(self, service: ServiceInfo) -> Dict[Any, Any]:
         return {
             "name": service.name,
@@ -204,26 +394,29 @@ class SupabaseDal:
         if not services:
             return
         db_services = [self.to_service(service) for service in services]
-        res = self.client.table(SERVICES_TABLE).insert(db_services, upsert=True).execute()
+        res = self.__upsert_in_batches(SERVICES_TABLE, db_services)
         if res.get("status_code") not in [200, 201]:
             logging.error(f"Failed to persist services {services} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             status_code = res.get("status_code")
             raise Exception(f"publish service failed. status: {status_code}")
 
     def get_active_services(self) -> List[ServiceInfo]:
-        res = (
-            self.client.table(SERVICES_TABLE)
-            .select("name", "type", "namespace", "classification", "config", "ready_pods", "total_pods")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster", "eq", self.cluster)
-            .filter("deleted", "eq", False)
-            .execute()
+        res = self.__select_active(
+            SERVICES_TABLE,
+            "name",
+            "type",
+            "namespace",
+            "classification",
+            "config",
+            "ready_pods",
+            "total_pods",
+            scope_params=self._services_scope_params,
         )
         if res.get("status_code") not in [200]:
             msg = f"Failed to get existing services (supabase) error: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(msg)
         return [
             ServiceInfo(
@@ -239,35 +432,42 @@ class SupabaseDal:
         ]
 
     def has_cluster_findings(self) -> bool:
-        res = (
-            self.client.table(ISSUES_TABLE)
-            .select("*")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster", "eq", self.cluster)
-            .limit(1)
-            .execute()
+        # fetch only the id of a single issue. Serializing the full (wide) row isn't needed to check existence
+        res = self.__select(
+            ISSUES_TABLE,
+            {"select": "id", "account_id": f"eq.{self.account_id}", "cluster": f"eq.{self.cluster}", "limit": "1"},
         )
         if res.get("status_code") not in [200]:
             msg = f"Failed to check cluster issues: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(msg)
 
         return len(res.get("data")) > 0
 
     def get_active_nodes(self) -> List[NodeInfo]:
-        res = (
-            self.client.table(NODES_TABLE)
-            .select("*")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster_id", "eq", self.cluster)
-            .filter("deleted", "eq", False)
-            .execute()
+        res = self.__select_active(
+            NODES_TABLE,
+            "name",
+            "node_creation_time",
+            "taints",
+            "conditions",
+            "memory_capacity",
+            "memory_allocatable",
+            "memory_allocated",
+            "cpu_capacity",
+            "cpu_allocatable",
+            "cpu_allocated",
+            "pods_count",
+            "pods",
+            "internal_ip",
+            "external_ip",
+            "node_info",
         )
         if res.get("status_code") not in [200]:
             msg = f"Failed to get existing nodes (supabase) error: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(msg)
 
         return [
@@ -286,53 +486,48 @@ class SupabaseDal:
                 pods=node["pods"],
                 internal_ip=node["internal_ip"],
                 external_ip=node["external_ip"],
-                node_info=json.loads(node["node_info"]),
+                node_info=self.__to_node_info(node["node_info"]),
             )
             for node in res.get("data")
         ]
 
+    @staticmethod
+    def __to_node_info(db_node_info: Union[str, Dict]) -> Dict:
+        # json columns are already decoded by PostgREST. Only text columns need parsing
+        return json_loads(db_node_info) if isinstance(db_node_info, str) else db_node_info
+
+    def __to_db_row(self, db_row: Dict[Any, Any]) -> Dict[Any, Any]:
+        db_row.update(self._row_stamp)
+        return db_row
+
     def __to_db_node(self, node: NodeInfo) -> Dict[Any, Any]:
-        db_node = node.dict()
-        db_node["account_id"] = self.account_id
-        db_node["cluster_id"] = self.cluster
-        db_node["updated_at"] = "now()"
-        return db_node
+        return self.__to_db_row(node.dict())
 
     def publish_nodes(self, nodes: List[NodeInfo]):
         if not nodes:
             return
 
         db_nodes = [self.__to_db_node(node) for node in nodes]
-        res = self.client.table(NODES_TABLE).insert(db_nodes, upsert=True).execute()
+        res = self.__upsert_in_batches(NODES_TABLE, db_nodes)
         if res.get("status_code") not in [200, 201]:
             logging.error(f"Failed to persist node {nodes} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             status_code = res.get("status_code")
             raise Exception(f"publish nodes failed. status: {status_code}")
 
     def get_active_jobs(self) -> List[JobInfo]:
-        res = (
-            self.client.table(JOBS_TABLE)
-            .select("*")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster_id", "eq", self.cluster)
-            .filter("deleted", "eq", False)
-            .execute()
-        )
+        res = self.__select_active(JOBS_TABLE)
         if res.get("status_code") not in [200]:
             msg = f"Failed to get existing jobs (supabase) error: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(msg)
 
         return [JobInfo.from_db_row(job) for job in res.get("data")]
 
     def __to_db_job(self, job: JobInfo) -> Dict[Any, Any]:
-        db_job = job.dict()
-        db_job["account_id"] = self.account_id
-        db_job["cluster_id"] = self.cluster
+        db_job = self.__to_db_row(job.dict())
         db_job["service_key"] = job.get_service_key()
-        db_job["updated_at"] = "now()"
         return db_job
 
     def publish_jobs(self, jobs: List[JobInfo]):
@@ -340,10 +535,10 @@ class SupabaseDal:
             return
 
         db_jobs = [self.__to_db_job(job) for job in jobs]
-        res = self.client.table(JOBS_TABLE).insert(db_jobs, upsert=True).execute()
+        res = self.__upsert_in_batches(JOBS_TABLE, db_jobs)
         if res.get("status_code") not in [200, 201]:
             logging.error(f"Failed to persist jobs {jobs} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             status_code = res.get("status_code")
             raise Exception(f"publish jobs failed. status: {status_code}")
 
@@ -352,43 +547,34 @@ class SupabaseDal:
             return
 
         res = self.__delete_patch(
-            self.client.table(JOBS_TABLE)
-            .delete()
-            .eq("account_id", self.account_id)
-            .eq("cluster_id", self.cluster)
-            .eq("service_key", job.get_service_key())
+            JOBS_TABLE,
+            {
+                "account_id": f"eq.{self.account_id}",
+                "cluster_id": f"eq.{self.cluster}",
+                "service_key": f"eq.{job.get_service_key()}",
+            },
         )
         status_code = res.get("status_code")
         valid_deleted_statuses = [204, 200, 202]
         if status_code not in valid_deleted_statuses:
             logging.error(f"Failed to delete job {job} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(f"remove deleted job failed. status: {status_code}")
 
     # helm release
     def get_active_helm_release(self) -> List[HelmRelease]:
-        res = (
-            self.client.table(HELM_RELEASES_TABLE)
-            .select("*")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster_id", "eq", self.cluster)
-            .filter("deleted", "eq", False)
-            .execute()
-        )
+        res = self.__select_active(HELM_RELEASES_TABLE)
         if res.get("status_code") not in [200]:
             msg = f"Failed to get existing helm releases (supabase) error: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(msg)
 
         return [HelmRelease.from_db_row(helm_release) for helm_release in res.get("data")]
 
     def __to_db_helm_release(self, helm_release: HelmRelease) -> Dict[Any, Any]:
-        db_helm_release = helm_release.dict()
-        db_helm_release["account_id"] = self.account_id
-        db_helm_release["cluster_id"] = self.cluster
+        db_helm_release = self.__to_db_row(helm_release.dict())
         db_helm_release["service_key"] = helm_release.get_service_key()
-        db_helm_release["updated_at"] = "now()"
         return db_helm_release
 
     def publish_helm_releases(self, helm_releases: List[HelmRelease]):
@@ -396,30 +582,90 @@ class SupabaseDal:
             return
 
         db_helm_releases = [self.__to_db_helm_release(helm_release) for helm_release in helm_releases]
-        logging.debug(f"[supabase] Publishing the helm_releases {db_helm_releases}")
+        logging.debug("[supabase] Publishing the helm_releases %s", db_helm_releases)
 
-        res = self.client.table(HELM_RELEASES_TABLE).insert(db_helm_releases, upsert=True).execute()
+        res = self.__upsert_in_batches(HELM_RELEASES_TABLE, db_helm_releases)
         if res.get("status_code") not in [200, 201]:
             logging.error(f"Failed to persist helm_releases {helm_releases} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             status_code = res.get("status_code")
             raise Exception(f"publish helm_releases failed. status: {status_code}")
 
-    @staticmethod
-    def __delete_patch(supabase_request_obj: QueryRequestBuilder) -> Dict[str, Any]:
+    def __select_active(
+        self, table: str, *columns: str, scope_params: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
         """
-        supabase_py's QueryBuilder has a bug for delete where the response 204 (no content)
-        is attempted to be converted to a json, which throws an error every time
+        Select the cluster rows that aren't deleted.
+        The scope filters are fixed, so they're built once instead of chaining filters on a new builder every call
+        """
+        params = {"select": ",".join(columns) if columns else "*", **(scope_params or self._scope_params)}
+        return self.__select(table, params)
+
+    def __select(self, table: str, params: Dict[str, str]) -> Dict[str, Any]:
+        response = self._http.get(
+            f"{self._rest_url}/{table}",
+            params=params,
+            headers=self.client._get_auth_headers(),
+            timeout=HTTP_TIMEOUT_SEC,
+        )
+        return {
+            "data": json_loads(response.content) if response.content else {},
+            "status_code": response.status_code,
+        }
+
+    def __upsert_in_batches(self, table: str, db_rows: List[Dict[Any, Any]]) -> Dict[str, Any]:
+        """
+        Upsert the rows in batches of INSERT_BATCH_SIZE, to stay below the request size limits.
+        Stops on the first failing batch, and returns its result
+        """
+        res: Dict[str, Any] = {}
+        for start in range(0, len(db_rows), INSERT_BATCH_SIZE):
+            batch = db_rows[start : start + INSERT_BATCH_SIZE]
+            res = self.__execute(self.client.table(table).insert(batch, upsert=True))
+            if res.get("status_code") not in [200, 201]:
+                return res
+        return res
+
+    def __execute(self, supabase_request_obj: QueryRequestBuilder) -> Dict[str, Any]:
+        """
+        supabase_py's execute uses the module level requests functions, which opens a new connection for every call.
+        Send the same request over the dal pooled session instead
         """
         url: str = str(supabase_request_obj.session.base_url).rstrip("/")
+        query: str = str(supabase_request_obj.session.params)
+        method: str = supabase_request_obj.http_method.upper()
+        additional_kwargs: Dict[str, Any] = {}
+        headers = supabase_request_obj.session.headers
+        if method in ["POST", "PUT", "PATCH"]:
+            additional_kwargs["data"] = json_dumps(supabase_request_obj.json)
+            headers["Content-Type"] = JSON_CONTENT_TYPE
+            # The written rows are never used. With return=minimal PostgREST doesn't select and send them back
+            headers["Prefer"] = headers.get("Prefer", "").replace(RETURN_REPRESENTATION, RETURN_MINIMAL)
+
+        response = self._http.request(
+            method, f"{url}?{query}", headers=headers, timeout=HTTP_TIMEOUT_SEC, **additional_kwargs
+        )
+        return {
+            "data": json_loads(response.content) if response.content else {},
+            "status_code": response.status_code,
+        }
 
-        # postgres_py (which supabase cli uses) adds quotation marks around params with the characters ",.:()"
-        # supabase does not support this format
-        query: str = str(supabase_request_obj.session.params).replace("%22", "")
-        response = requests.delete(f"{url}?{query}", headers=supabase_request_obj.session.headers)
+    def __delete_patch(self, table: str, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        supabase_py's QueryBuilder has a bug for delete where the response 204 (no content)
+        is attempted to be converted to a json, which throws an error every time.
+        postgrest_py also adds quotation marks around params with the characters ",.:()", which supabase does not
+        support, so the PostgREST filters are passed as plain query params
+        """
+        response = self._http.delete(
+            f"{self._rest_url}/{table}",
+            params=params,
+            headers=self.client._get_auth_headers(),
+            timeout=HTTP_TIMEOUT_SEC,
+        )
         response_data = ""
         try:
-            response_data = response.json()
+            response_data = json_loads(response.content)
         except Exception:  # this can be okay if no data is expected
             logging.debug("Failed to parse delete response data")
 
@@ -432,14 +678,14 @@ class SupabaseDal:
         """
         Supabase client is async. Sync impl of rpc call
         """
-        builder = self.client.table(f"rpc/{func_name}")  # rpc builder
-        url: str = str(builder.session.base_url).rstrip("/")
-
-        response = requests.post(url, headers=builder.session.headers, json=params)
+        headers = {**self.client._get_auth_headers(), "Prefer": RETURN_MINIMAL, "Content-Type": JSON_CONTENT_TYPE}
+        response = self._http.post(
+            f"{self._rest_url}/rpc/{func_name}", headers=headers, data=json_dumps(params), timeout=HTTP_TIMEOUT_SEC
+        )
         response_data = {}
         try:
             if response.content:
-                response_data = response.json()
+                response_data = json_loads(response.content)
         except Exception:  # this can be okay if no data is expected
             logging.debug("Failed to parse delete response data")
 
@@ -449,17 +695,22 @@ class SupabaseDal:
         }
 
     def sign_in(self):
-        if time.time() > self.sign_in_time + SUPABASE_LOGIN_RATE_LIMIT_SEC:
-            logging.info("Supabase dal login")
-            self.sign_in_time = time.time()
-            self.client.auth.sign_in(email=self.email, password=self.password)
-
-    def handle_supabase_error(self):
+        # discovery publishers call the dal concurrently. Only one of them should login, and start a refresh chain
+        with self._sign_in_lock:
+            if time.time() > self.sign_in_time + SUPABASE_LOGIN_RATE_LIMIT_SEC:
+                logging.info("Supabase dal login")
+                self.sign_in_time = time.time()
+                self.client.auth.sign_in(email=self.email, password=self.password)
+
+    def handle_supabase_error(self, status_code: Optional[int] = None):
         """Workaround for Gotrue bug in refresh token."""
         # If there's an error during refresh token, no new refresh timer task is created, and the client remains not authenticated for good
         # When there's an error connecting to supabase server, we will re-login, to re-authenticate the session.
         # Adding rate-limiting mechanism, not to login too much because of other errors
         # https://github.com/supabase/gotrue-py/issues/9
+        if status_code is not None and status_code not in AUTH_ERROR_STATUS_CODES:
+            return  # not an authentication error. Login again would only add load on supabase
+
         try:
             self.sign_in()
         except Exception:
@@ -471,56 +722,48 @@ class SupabaseDal:
             del db_cluster_status["last_alert_at"]
 
         db_cluster_status["updated_at"] = "now()"
+        return db_cluster_status
 
-        log_cluster_status = db_cluster_status.copy()
-        log_cluster_status["light_actions"] = len(data.light_actions)
-        logging.info(f"cluster status {log_cluster_status}")
+    @staticmethod
+    def __log_cluster_status(cluster_status: ClusterStatus, db_cluster_status: Dict[str, Any]):
+        if not logging.getLogger().isEnabledFor(logging.INFO):
+            return  # skip copying the status when it's not logged
 
-        return db_cluster_status
+        log_cluster_status = db_cluster_status.copy()
+        log_cluster_status["light_actions"] = len(cluster_status.light_actions)
+        logging.info("cluster status %s", log_cluster_status)
 
     def publish_cluster_status(self, cluster_status: ClusterStatus):
-        res = (
-            self.client.table(CLUSTERS_STATUS_TABLE)
-            .insert(self.to_db_cluster_status(cluster_status), upsert=True)
-            .execute()
-        )
+        db_cluster_status = self.to_db_cluster_status(cluster_status)
+        self.__log_cluster_status(cluster_status, db_cluster_status)
+
+        res = self.__execute(self.client.table(CLUSTERS_STATUS_TABLE).insert(db_cluster_status, upsert=True))
         if res.get("status_code") not in [200, 201]:
-            logging.error(f"Failed to upsert {self.to_db_cluster_status(cluster_status)} error: {res.get('data')}")
-            self.handle_supabase_error()
+            logging.error(f"Failed to upsert {db_cluster_status} error: {res.get('data')}")
+            self.handle_supabase_error(res.get("status_code"))
 
     def get_active_namespaces(self) -> List[NamespaceInfo]:
-        res = (
-            self.client.table(NAMESPACES_TABLE)
-            .select("*")
-            .filter("account_id", "eq", self.account_id)
-            .filter("cluster_id", "eq", self.cluster)
-            .filter("deleted", "eq", False)
-            .execute()
-        )
+        res = self.__select_active(NAMESPACES_TABLE)
         if res.get("status_code") not in [200]:
             msg = f"Failed to get existing namespaces (supabase) error: {res.get('data')}"
             logging.error(msg)
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             raise Exception(f"get active namespaces failed. status: {res.get('status_code')}")
 
         return [NamespaceInfo.from_db_row(namespace) for namespace in res.get("data")]
 
     def __to_db_namespace(self, namespace: NamespaceInfo) -> Dict[Any, Any]:
-        db_job = namespace.dict()
-        db_job["account_id"] = self.account_id
-        db_job["cluster_id"] = self.cluster
-        db_job["updated_at"] = "now()"
-        return db_job
+        return self.__to_db_row(namespace.dict())
 
     def publish_namespaces(self, namespaces: List[NamespaceInfo]):
         if not namespaces:
             return
 
         db_namespaces = [self.__to_db_namespace(namespace) for namespace in namespaces]
-        res = self.client.table(NAMESPACES_TABLE).insert(db_namespaces, upsert=True).execute()
+        res = self.__upsert_in_batches(NAMESPACES_TABLE, db_namespaces)
         if res.get("status_code") not in [200, 201]:
             logging.error(f"Failed to persist namespaces {namespaces} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
             status_code = res.get("status_code")
             raise Exception(f"publish namespaces failed. status: {status_code}")
 
@@ -534,6 +777,25 @@ class SupabaseDal:
 
         if res.get("status_code") not in [200, 201, 204]:
             logging.error(f"Failed to publish node count {data} error: {res.get('data')}")
-            self.handle_supabase_error()
+            self.handle_supabase_error(res.get("status_code"))
+
+        logging.info("cluster nodes: %s => %s", UPDATE_CLUSTER_NODE_COUNT, data)
+
+    def publish_cluster_heartbeat(self, cluster_status: ClusterStatus, node_count: int):
+        """
+        Publish the cluster status and the cluster node count in a single rpc call.
+        Same as publish_cluster_status followed by publish_cluster_nodes, with one round trip instead of two
+        """
+        db_cluster_status = self.to_db_cluster_status(cluster_status)
+        self.__log_cluster_status(cluster_status, db_cluster_status)
 
-        logging.info(f"cluster nodes: {UPDATE_CLUSTER_NODE_COUNT} => {data}")
+        data = {
+            "_account_id": self.account_id,
+            "_cluster_id": self.cluster,
+            "_status": db_cluster_status,
+            "_node_count": node_count,
+        }
+        res = self.__rpc_patch(UPDATE_CLUSTER_STATUS_AND_NODES, data)
+        if res.get("status_code") not in [200, 201, 204]:
+            logging.error(f"Failed to publish cluster heartbeat {data} error: {res.get('data')}")
+            self.handle_supabase_error(res.get("status_code"))
@@ -1,4 +1,5 @@
 import base64
+import concurrent.futures
 import json
 import logging
 import threading
@@ -10,7 +11,13 @@ from kubernetes.client import V1Node, V1NodeCondition, V1NodeList, V1Taint
 from robusta.core.discovery.discovery import Discovery, DiscoveryResults
 from robusta.core.discovery.top_service_resolver import TopLevelResource, TopServiceResolver
 from robusta.core.model.cluster_status import ClusterStatus, ClusterStats, ActivityStats
-from robusta.core.model.env_vars import CLUSTER_STATUS_PERIOD_SEC, DISCOVERY_CHECK_THRESHOLD_SEC, DISCOVERY_PERIOD_SEC
+from robusta.core.model.env_vars import (
+    CLUSTER_STATUS_PERIOD_SEC,
+    DISCOVERY_CHECK_THRESHOLD_SEC,
+    DISCOVERY_PERIOD_SEC,
+    DISCOVERY_PUBLISH_WORKERS,
+    SUPABASE_COMBINED_HEARTBEAT,
+)
 from robusta.core.model.helm_release import HelmRelease
 from robusta.core.model.jobs import JobInfo
 from robusta.core.model.namespaces import NamespaceInfo
@@ -72,6 +79,9 @@ class RobustaSink(SinkBase):
         # helps differentiate between no jobs, to not initialized
         self.__jobs_cache: Optional[Dict[str, JobInfo]] = None
         self.__helm_releases_cache: Optional[Dict[str, HelmRelease]] = None
+        self.__publish_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=DISCOVERY_PUBLISH_WORKERS, thread_name_prefix="discovery-publish"
+        )
         self.__init_service_resolver()
         self.__thread = threading.Thread(target=self.__discover_cluster)
         self.__thread.start()
@@ -152,6 +162,8 @@ class RobustaSink(SinkBase):
         self.dal.persist_finding(finding)
 
     def __publish_new_services(self, active_services: List[ServiceInfo]):
+        self.__assert_services_cache_initialized()
+
         # convert to map
         curr_services = {}
         for service in active_services:
@@ -211,20 +223,22 @@ class RobustaSink(SinkBase):
         try:
             results: DiscoveryResults = Discovery.discover_resources()
 
-            self.__assert_services_cache_initialized()
-            self.__publish_new_services(results.services)
+            # each resource type has its own cache and tables, so they're published concurrently
+            publish_futures = [
+                self.__publish_executor.submit(self.__publish_new_services, results.services),
+                self.__publish_executor.submit(self.__publish_new_jobs, results.jobs),
+                self.__publish_executor.submit(self.__publish_new_helm_releases, results.helm_releases),
+                self.__publish_executor.submit(self.__publish_new_namespaces, results.namespaces),
+            ]
             if results.nodes:
-                self.__assert_node_cache_initialized()
-                self.__publish_new_nodes(results.nodes, results.node_requests)
-
-            self.__assert_jobs_cache_initialized()
-            self.__publish_new_jobs(results.jobs)
-
-            self.__assert_helm_releases_cache_initialized()
-            self.__publish_new_helm_releases(results.helm_releases)
+                publish_futures.append(
+                    self.__publish_executor.submit(self.__publish_new_nodes, results.nodes, results.node_requests)
+                )
 
-            self.__assert_namespaces_cache_initialized()
-            self.__publish_new_namespaces(results.namespaces)
+            # wait for all the publishers before raising, so the caches aren't reset while still being updated
+            concurrent.futures.wait(publish_futures)
+            for future in publish_futures:
+                future.result()
 
             # save the cached services for the resolver.
             RobustaSink.__save_resolver_resources(
@@ -295,6 +309,8 @@ class RobustaSink(SinkBase):
         )
 
     def __publish_new_nodes(self, current_nodes: V1NodeList, node_requests: Dict[str, List[PodResources]]):
+        self.__assert_node_cache_initialized()
+
         # convert to map
         curr_nodes = {}
         for node in current_nodes.items:
@@ -329,6 +345,8 @@ class RobustaSink(SinkBase):
             logging.error(f"Failed to delete job with service key {job_key}", exc_info=True)
 
     def __publish_new_jobs(self, active_jobs: List[JobInfo]):
+        self.__assert_jobs_cache_initialized()
+
         # convert to map
         curr_jobs = {}
         for job in active_jobs:
@@ -351,6 +369,8 @@ class RobustaSink(SinkBase):
         self.dal.publish_jobs(updated_jobs)
 
     def __publish_new_helm_releases(self, active_helm_releases: List[HelmRelease]):
+        self.__assert_helm_releases_cache_initialized()
+
         curr_helm_releases = {}
         for helm_release in active_helm_releases:
             curr_helm_releases[helm_release.get_service_key()] = helm_release
@@ -427,8 +447,11 @@ class RobustaSink(SinkBase):
                 activity_stats=activity_stats
             )
 
-            self.dal.publish_cluster_status(cluster_status)
-            self.dal.publish_cluster_nodes(cluster_stats.nodes)
+            if SUPABASE_COMBINED_HEARTBEAT:
+                self.dal.publish_cluster_heartbeat(cluster_status, cluster_stats.nodes)
+            else:
+                self.dal.publish_cluster_status(cluster_status)
+                self.dal.publish_cluster_nodes(cluster_stats.nodes)
         except Exception:
             logging.exception(
                 f"Failed to run periodic update cluster status for {self.sink_name}",
@@ -465,6 +488,7 @@ class RobustaSink(SinkBase):
             logging.debug(f"Discovery duration: {duration} next discovery in {sleep_dur}")
             time.sleep(sleep_dur)
 
+        self.__publish_executor.shutdown(wait=False)
         logging.info(f"Service discovery for sink {self.sink_name} ended.")
 
     def __periodic_cluster_status(self):
@@ -478,6 +502,8 @@ class RobustaSink(SinkBase):
             self.__update_cluster_status()
 
     def __publish_new_namespaces(self, namespaces: List[NamespaceInfo]):
+        self.__assert_namespaces_cache_initialized()
+
         # convert to map
         curr_namespaces = {namespace.name: namespace for namespace in namespaces}
 
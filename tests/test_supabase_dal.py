@@ -0,0 +1,104 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from unittest.mock import MagicMock, patch
+
+from robusta.core.sinks.robusta.dal.supabase_dal import INSERT_BATCH_SIZE, RefreshScheduler, RobustaClient, SupabaseDal
+
+
+def test_refresh_scheduler_runs_tasks_by_due_time():
+    executed = []
+    done = threading.Event()
+
+    def task(name: str):
+        executed.append(name)
+        if len(executed) == 3:
+            done.set()
+
+    RefreshScheduler.schedule(0.6, lambda: task("late"))
+    RefreshScheduler.schedule(0.1, lambda: task("early"))
+    RefreshScheduler.schedule(0.3, lambda: task("middle"))
+
+    assert done.wait(5)
+    assert executed == ["early", "middle", "late"]
+
+
+def test_refresh_scheduler_survives_failing_task():
+    done = threading.Event()
+
+    def failing_task():
+        raise Exception("refresh failed")
+
+    RefreshScheduler.schedule(0.1, failing_task)
+    RefreshScheduler.schedule(0.2, done.set)
+
+    assert done.wait(5)
+
+
+def test_refresh_scheduler_uses_single_thread():
+    done = threading.Event()
+    RefreshScheduler.schedule(0.1, done.set)
+    assert done.wait(5)
+
+    for _ in range(10):
+        RefreshScheduler.schedule(0.1, lambda: None)
+
+    refresh_threads = [thread for thread in threading.enumerate() if thread.name == "supabase-token-refresh"]
+    assert len(refresh_threads) == 1
+
+
+def _upsert_batches(db_rows: List[Dict], failing_batch: Optional[int] = None) -> Tuple[Dict[str, Any], List[int]]:
+    """Run the dal batched upsert, returning its result and the size of each sent batch"""
+    sent_batches = []
+
+    def execute(dal, batch):
+        sent_batches.append(len(batch))
+        status_code = 400 if len(sent_batches) - 1 == failing_batch else 201
+        return {"data": {}, "status_code": status_code}
+
+    dal = SupabaseDal.__new__(SupabaseDal)
+    dal.client = MagicMock()
+    dal.client.table.return_value.insert.side_effect = lambda batch, upsert: batch
+    with patch.object(SupabaseDal, "_SupabaseDal__execute", execute):
+        res = dal._SupabaseDal__upsert_in_batches("Nodes", db_rows)
+
+    return res, sent_batches
+
+
+def test_upsert_in_batches_no_rows():
+    res, sent_batches = _upsert_batches([])
+    assert res == {}
+    assert sent_batches == []
+
+
+def test_upsert_in_batches_full_batch():
+    res, sent_batches = _upsert_batches([{"name": i} for i in range(INSERT_BATCH_SIZE)])
+    assert res["status_code"] == 201
+    assert sent_batches == [INSERT_BATCH_SIZE]
+
+
+def test_upsert_in_batches_partial_last_batch():
+    res, sent_batches = _upsert_batches([{"name": i} for i in range(INSERT_BATCH_SIZE + 1)])
+    assert res["status_code"] == 201
+    assert sent_batches == [INSERT_BATCH_SIZE, 1]
+
+
+def test_upsert_in_batches_stops_on_failing_batch():
+    res, sent_batches = _upsert_batches([{"name": i} for i in range(3 * INSERT_BATCH_SIZE)], failing_batch=1)
+    assert res["status_code"] == 400
+    assert sent_batches == [INSERT_BATCH_SIZE, INSERT_BATCH_SIZE]
+
+
+def test_auth_headers_follow_access_token():
+    client = RobustaClient.__new__(RobustaClient)
+    client.supabase_key = "anon-key"
+    client.auth = MagicMock()
+    client.auth.current_session = {"access_token": "token-1"}
+    assert client._get_auth_headers()["Authorization"] == "Bearer token-1"
+
+    client.auth.current_session["access_token"] = "token-2"
+    headers = client._get_auth_headers()
+    assert headers["Authorization"] == "Bearer token-2"
+    assert headers["apiKey"] == "anon-key"
+
+    client.auth.current_session = None
+    assert client._get_auth_headers()["Authorization"] == "Bearer anon-key"